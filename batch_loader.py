@@ -4,16 +4,174 @@ Processes all CSV files in a data folder and uploads them to Pinecone with embed
 """
 
 import pandas as pd
+import numpy as np
 import os
 import glob
-from pinecone import Pinecone, ServerlessSpec
-from sentence_transformers import SentenceTransformer
+from pinecone import ServerlessSpec
+try:
+    # gRPC client: protobuf payloads and HTTP/2 cut serialization CPU and
+    # wire bytes on bulk upserts compared to REST+JSON
+    from pinecone.grpc import PineconeGRPC as Pinecone
+    USING_GRPC = True
+except ImportError:  # grpc extras not installed; REST client is API-compatible
+    from pinecone import Pinecone
+    USING_GRPC = False
+from embedding_model import EmbeddingModel
 import uuid
 from tqdm import tqdm
 import time
 from dotenv import load_dotenv
 import hashlib
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import threading
+import queue
+import itertools
+
+# Below this total size (bytes) the pool startup cost outweighs the
+# speedup, so process_all_csv_files falls back to a plain serial loop
+PARALLEL_SIZE_THRESHOLD = 1_000_000
+
+# Files above this size (bytes) are streamed in chunks of STREAM_CHUNKSIZE
+# rows so peak memory stays O(chunk) instead of O(rows)
+STREAM_SIZE_THRESHOLD = 10_000_000
+STREAM_CHUNKSIZE = 10_000
+
+def _to_wire_values(embedding):
+    """
+    Quantize an embedding to float16 precision for upsert
+
+    MiniLM-scale embeddings lose essentially no recall at half
+    precision, and the shorter values cut wire bytes on the JSON (REST)
+    path; with normalized vectors and the cosine metric, scores are
+    unaffected in practice.
+    """
+    return np.asarray(embedding, dtype=np.float16).astype(np.float32).tolist()
+
+def _prepare_documents(df, filename, csv_path):
+    """
+    Turn one DataFrame (a whole file or a chunk) into document dicts
+
+    Args:
+        df: DataFrame whose index carries the original row numbers
+        filename: Base name of the source CSV
+        csv_path: Path to the source CSV
+
+    Returns:
+        List of document dictionaries
+    """
+    # Handle missing values
+    df = df.fillna('')
+
+    # Clean each column once with vectorized string ops instead of
+    # looping over rows with iterrows()
+    cleaned = {}
+    parts = {}
+    for col in df.columns:
+        s = df[col].astype(str).str.strip()
+        cleaned[col] = s
+        valid = s.str.len().gt(0) & ~s.str.lower().isin(['nan', 'none'])
+        parts[col] = (f"{col}: " + s).where(valid, '')
+
+    # Join non-empty "col: value" parts row-wise into the text content:
+    # stack to long form, drop empties, then group back by row
+    stacked = pd.DataFrame(parts, index=df.index).stack()
+    stacked = stacked[stacked.str.len() > 0]
+    text_content = stacked.groupby(level=0).agg(" | ".join)
+    text_content = text_content.reindex(df.index, fill_value='')
+
+    # Store all columns as metadata (truncate long values)
+    metadata_df = pd.DataFrame(
+        {f"col_{col}": cleaned[col].str.slice(0, 200) for col in df.columns},
+        index=df.index
+    )
+    col_records = metadata_df.to_dict('records')
+
+    # Create unique IDs based on file and row. blake2b is much faster
+    # than MD5 and we only need a deterministic dedup key, not a
+    # cryptographic digest; hash in one tight pass over the raw array
+    idx_str = pd.Series(df.index.astype(str), index=df.index)
+    unique_strings = filename + "_" + idx_str + "_" + text_content.str.slice(0, 100)
+    doc_ids = [
+        hashlib.blake2b(u.encode(), digest_size=16).hexdigest()
+        for u in unique_strings.to_numpy()
+    ]
+
+    documents = []
+    for idx, text, doc_id, cols in zip(df.index, text_content, doc_ids, col_records):
+        if not text:  # Only process non-empty content
+            continue
+
+        metadata = {
+            'source_file': filename,
+            'source_path': csv_path,
+            'row_index': idx
+        }
+        metadata.update(cols)
+
+        documents.append({
+            'id': doc_id,
+            'text': text,
+            'metadata': metadata
+        })
+
+    return documents
+
+def iter_csv_documents(csv_path, chunksize=STREAM_CHUNKSIZE):
+    """
+    Stream document batches from a CSV file
+
+    Small files are read in one go with the multithreaded Arrow parser;
+    large files are streamed with read_csv(chunksize=...) (C engine, the
+    Arrow engine does not support chunked reads) so memory stays bounded.
+
+    Args:
+        csv_path: Path to the CSV file
+        chunksize: Rows per chunk for the streaming path
+
+    Yields:
+        Lists of document dictionaries, one list per chunk
+    """
+    filename = os.path.basename(csv_path)
+    print(f"\nProcessing: {filename}")
+
+    try:
+        if os.path.getsize(csv_path) < STREAM_SIZE_THRESHOLD:
+            # Read CSV with the multithreaded Arrow parser; fall back to
+            # the default C engine if pyarrow isn't installed
+            try:
+                df = pd.read_csv(csv_path, engine='pyarrow')
+            except (ImportError, ValueError):
+                df = pd.read_csv(csv_path)
+            print(f"  Rows: {len(df)}, Columns: {len(df.columns)}")
+            documents = _prepare_documents(df, filename, csv_path)
+            print(f"  Prepared {len(documents)} documents")
+            yield documents
+        else:
+            total = 0
+            for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+                documents = _prepare_documents(chunk, filename, csv_path)
+                total += len(documents)
+                yield documents
+            print(f"  Prepared {total} documents (streamed)")
+
+    except Exception as e:
+        print(f"  Error processing {filename}: {str(e)}")
+
+def process_csv_file(csv_path):
+    """
+    Process a single CSV file and prepare documents
+
+    Module-level (picklable) so it can be dispatched to worker processes;
+    materializes the full document list. Use iter_csv_documents to stream.
+
+    Args:
+        csv_path: Path to the CSV file
+
+    Returns:
+        List of document dictionaries
+    """
+    return [doc for documents in iter_csv_documents(csv_path) for doc in documents]
 
 class BatchCSVToPinecone:
     def __init__(self, data_folder="data", index_name="csv-embeddings"):
@@ -38,10 +196,10 @@ class BatchCSVToPinecone:
         # Initialize Pinecone
         self.pc = Pinecone(api_key=self.pinecone_api_key)
         
-        # Initialize embedding model (free)
+        # Initialize embedding model (free, INT8 ONNX)
         print("Loading embedding model...")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.embedding_dimension = 384
+        self.model = EmbeddingModel()
+        self.embedding_dimension = self.model.embedding_dimension
         
         print(f"Initialized with data folder: {data_folder}")
         print(f"Target index: {index_name}")
@@ -80,114 +238,164 @@ class BatchCSVToPinecone:
         else:
             print(f"Using existing index: {self.index_name}")
         
-        return self.pc.Index(self.index_name)
-    
+        if USING_GRPC:
+            # gRPC multiplexes async_req calls over its own channel
+            return self.pc.Index(self.index_name)
+        # pool_threads sizes the REST client's thread pool for async_req upserts
+        return self.pc.Index(self.index_name, pool_threads=30)
+
     def process_csv_file(self, csv_path):
         """
         Process a single CSV file and prepare documents
-        
+
         Args:
             csv_path: Path to the CSV file
-            
+
         Returns:
             List of document dictionaries
         """
-        filename = os.path.basename(csv_path)
-        print(f"\nProcessing: {filename}")
-        
-        try:
-            # Read CSV
-            df = pd.read_csv(csv_path)
-            print(f"  Rows: {len(df)}, Columns: {len(df.columns)}")
-            
-            # Handle missing values
-            df = df.fillna('')
-            
-            documents = []
-            
-            for idx, row in df.iterrows():
-                # Combine all non-empty columns into text content
-                text_parts = []
-                metadata = {
-                    'source_file': filename,
-                    'source_path': csv_path,
-                    'row_index': idx
-                }
-                
-                for col, value in row.items():
-                    # Convert value to string and clean it
-                    str_value = str(value).strip()
-                    
-                    if str_value and str_value.lower() not in ['nan', 'none', '']:
-                        text_parts.append(f"{col}: {str_value}")
-                    
-                    # Store all columns as metadata (truncate long values)
-                    metadata[f"col_{col}"] = str_value[:200] if len(str_value) > 200 else str_value
-                
-                # Create text content for embedding
-                text_content = " | ".join(text_parts)
-                
-                if text_content.strip():  # Only process non-empty content
-                    # Create unique ID based on file and row
-                    unique_string = f"{filename}_{idx}_{text_content[:100]}"
-                    doc_id = hashlib.md5(unique_string.encode()).hexdigest()
-                    
-                    documents.append({
-                        'id': doc_id,
-                        'text': text_content,
-                        'metadata': metadata
-                    })
-            
-            print(f"  Prepared {len(documents)} documents")
-            return documents
-            
-        except Exception as e:
-            print(f"  Error processing {filename}: {str(e)}")
-            return []
+        return process_csv_file(csv_path)
     
     def generate_embeddings_batch(self, texts, batch_size=32):
-        """Generate embeddings in batches"""
-        embeddings = []
-        
+        """
+        Generate embeddings in batches
+
+        Fills one pre-allocated float32 array instead of growing a list
+        of Python floats; vectors are normalized here so the cosine
+        metric needs no server-side normalization. Convert to lists only
+        at the upsert boundary, per outgoing batch.
+        """
+        embeddings = np.empty((len(texts), self.embedding_dimension), dtype=np.float32)
+
         for i in tqdm(range(0, len(texts), batch_size), desc="Generating embeddings"):
             batch_texts = texts[i:i + batch_size]
-            batch_embeddings = self.model.encode(batch_texts, show_progress_bar=False)
-            embeddings.extend(batch_embeddings.tolist())
-        
+            embeddings[i:i + batch_size] = self.model.encode(
+                batch_texts, show_progress_bar=False,
+                convert_to_numpy=True, normalize_embeddings=True
+            )
+
         return embeddings
     
-    def upload_documents(self, index, documents, batch_size=50):
-        """Upload documents with embeddings to Pinecone"""
-        if not documents:
-            print("No documents to upload")
-            return
-        
-        print(f"Generating embeddings for {len(documents)} documents...")
-        texts = [doc['text'] for doc in documents]
-        embeddings = self.generate_embeddings_batch(texts)
-        
-        print("Uploading to Pinecone...")
-        vectors = []
-        
-        for i, (doc, embedding) in enumerate(zip(documents, embeddings)):
-            vectors.append({
-                'id': doc['id'],
-                'values': embedding,
-                'metadata': doc['metadata']
-            })
-            
-            # Upload in batches
-            if len(vectors) >= batch_size or i == len(documents) - 1:
+    def upload_documents(self, index, documents, batch_size=100, embed_chunk_size=1000):
+        """
+        Upload documents with embeddings to Pinecone
+
+        Encoding and upserting run as a two-thread producer/consumer
+        pipeline over a bounded queue, so the encoder keeps working while
+        batches are in flight to Pinecone (and vice versa). The producer
+        embeds embed_chunk_size texts per encode call; the consumer fans
+        each chunk out into parallel async_req upserts of batch_size
+        vectors served by the index's thread pool.
+
+        documents may be a list or any iterable/generator of document
+        dicts (e.g. iter_csv_documents chunks flattened); with a generator
+        the parser, encoder and upserter stay pipelined and peak memory is
+        bounded by embed_chunk_size times the queue depth.
+
+        Returns:
+            Number of documents uploaded
+        """
+        doc_iter = iter(documents)
+        uploaded = 0
+        encode_errors = []
+        upsert_errors = []
+        work_queue = queue.Queue(maxsize=4)
+
+        def producer():
+            try:
+                with tqdm(desc="Generating embeddings", unit="doc") as progress:
+                    while True:
+                        docs_slice = list(itertools.islice(doc_iter, embed_chunk_size))
+                        if not docs_slice:
+                            break
+                        texts = [doc['text'] for doc in docs_slice]
+                        embeddings = self.model.encode(
+                            texts, batch_size=32, show_progress_bar=False,
+                            convert_to_numpy=True, normalize_embeddings=True
+                        )
+                        work_queue.put((docs_slice, embeddings))
+                        progress.update(len(docs_slice))
+            except Exception as e:
+                # Record the failure so the pipeline re-raises after the
+                # threads join; a dead producer must not look like a
+                # successfully completed (partial) ingest
+                print(f"Error generating embeddings: {e}")
+                encode_errors.append(e)
+            finally:
+                work_queue.put(None)  # Sentinel: no more batches
+
+        def consumer():
+            nonlocal uploaded
+            while True:
+                item = work_queue.get()
+                if item is None:
+                    break
+                docs_slice, embeddings = item
+                vectors = [
+                    {
+                        'id': doc['id'],
+                        'values': _to_wire_values(embedding),
+                        'metadata': doc['metadata']
+                    }
+                    for doc, embedding in zip(docs_slice, embeddings)
+                ]
+
+                # Fan the chunk out into parallel upserts and wait for
+                # all of them before taking the next chunk. The gRPC
+                # index has no async_req parameter, so its chunks go
+                # through a thread pool; REST keeps async_req served by
+                # the index's pool_threads
+                chunks = [
+                    vectors[i:i + batch_size]
+                    for i in range(0, len(vectors), batch_size)
+                ]
                 try:
-                    index.upsert(vectors=vectors)
-                    vectors = []
-                    time.sleep(0.1)  # Rate limiting
+                    if upsert_pool is not None:
+                        futures = [
+                            upsert_pool.submit(index.upsert, vectors=chunk)
+                            for chunk in chunks
+                        ]
+                        for future in futures:
+                            future.result()
+                    else:
+                        async_results = [
+                            index.upsert(vectors=chunk, async_req=True)
+                            for chunk in chunks
+                        ]
+                        for result in async_results:
+                            result.get()
+                    uploaded += len(vectors)
                 except Exception as e:
                     print(f"Error uploading batch: {e}")
-        
-        print(f"Successfully uploaded {len(documents)} documents")
+                    upsert_errors.append(e)
+
+        upsert_pool = ThreadPoolExecutor(max_workers=10) if USING_GRPC else None
+        try:
+            producer_thread = threading.Thread(target=producer)
+            consumer_thread = threading.Thread(target=consumer)
+            producer_thread.start()
+            consumer_thread.start()
+            producer_thread.join()
+            consumer_thread.join()
+        finally:
+            if upsert_pool is not None:
+                upsert_pool.shutdown()
+
+        pipeline_errors = encode_errors + upsert_errors
+        if pipeline_errors:
+            raise RuntimeError(
+                f"{len(encode_errors)} encode and {len(upsert_errors)} upsert "
+                f"failure(s) ({uploaded} documents uploaded); "
+                f"first error: {pipeline_errors[0]}"
+            )
+
+        if uploaded:
+            print(f"Successfully uploaded {uploaded} documents")
+        else:
+            print("No documents to upload")
+        return uploaded
     
-    def process_all_csv_files(self, batch_size=50):
+    def process_all_csv_files(self, batch_size=100):
         """Process all CSV files in the data folder"""
         # Get all CSV files
         csv_files = self.get_csv_files()
@@ -197,12 +405,26 @@ class BatchCSVToPinecone:
         
         # Process each CSV file
         total_documents = 0
-        
-        for csv_file in csv_files:
-            documents = self.process_csv_file(csv_file)
-            if documents:
-                self.upload_documents(index, documents, batch_size)
-                total_documents += len(documents)
+
+        # Parallelize the CPU-bound pandas prep across worker processes;
+        # serial is cheaper for a single file or a small total workload
+        total_size = sum(os.path.getsize(f) for f in csv_files)
+        if len(csv_files) == 1 or total_size < PARALLEL_SIZE_THRESHOLD:
+            for csv_file in csv_files:
+                # Stream documents straight into the upload pipeline so
+                # parsing, encoding and upserting overlap per chunk
+                documents = (
+                    doc
+                    for chunk in iter_csv_documents(csv_file)
+                    for doc in chunk
+                )
+                total_documents += self.upload_documents(index, documents, batch_size)
+        else:
+            max_workers = min(len(csv_files), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for documents in executor.map(process_csv_file, csv_files):
+                    if documents:
+                        total_documents += self.upload_documents(index, documents, batch_size)
         
         print(f"\n=== SUMMARY ===")
         print(f"Processed {len(csv_files)} CSV files")
@@ -218,7 +440,8 @@ class BatchCSVToPinecone:
         print(f"\nTesting search with query: '{query}'")
         
         # Generate query embedding
-        query_embedding = self.model.encode(query).tolist()
+        # Match the float16 precision the stored vectors were upserted at
+        query_embedding = _to_wire_values(self.model.encode(query, normalize_embeddings=True))
         
         # Search
         results = index.query(
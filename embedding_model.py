@@ -0,0 +1,222 @@
+"""
+ONNX Runtime Embedding Model
+INT8-quantized all-MiniLM-L6-v2 as a drop-in replacement for SentenceTransformer
+"""
+
+import os
+import json
+import time
+import platform
+import numpy as np
+
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx")
+QUANTIZED_FILE = "model_quantized.onnx"
+TUNING_FILE = "thread_tuning.json"
+EMBEDDING_DIMENSION = 384
+
+def export_quantized_model(onnx_dir=ONNX_DIR):
+    """
+    Export MiniLM to ONNX and quantize it to dynamic INT8
+
+    Runs once and caches the result on disk; later calls just return the path.
+
+    Args:
+        onnx_dir: Directory to store the exported/quantized model
+
+    Returns:
+        Path to the quantized ONNX model file
+    """
+    quantized_path = os.path.join(onnx_dir, QUANTIZED_FILE)
+    if os.path.exists(quantized_path):
+        return quantized_path
+
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    print("Exporting embedding model to ONNX (one-time setup)...")
+    model = ORTModelForFeatureExtraction.from_pretrained(MODEL_ID, export=True)
+    model.save_pretrained(onnx_dir)
+
+    print("Quantizing ONNX model to INT8...")
+    quantizer = ORTQuantizer.from_pretrained(onnx_dir)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False)
+    quantizer.quantize(save_dir=onnx_dir, quantization_config=qconfig)
+
+    return quantized_path
+
+def tune_session_threads(quantized_path, sample_size=32):
+    """
+    Profile ONNX Runtime thread settings once and cache the winner
+
+    Runs a dummy batch through the model for every combination of
+    intra_op_num_threads in {1, 2, 4, 8, cpu_count} and
+    inter_op_num_threads in {1, 2}, keeps the lowest-latency pair, and
+    caches it to a JSON file keyed by model, CPU and sample size. Batch
+    encoding (sample_size=32) and single-query encoding (sample_size=1)
+    tune to different optima, hence the key.
+
+    Args:
+        quantized_path: Path to the quantized ONNX model
+        sample_size: Batch size to profile for
+
+    Returns:
+        (intra_op_num_threads, inter_op_num_threads) tuple
+    """
+    import onnxruntime as ort
+
+    cache_path = os.path.join(os.path.dirname(quantized_path), TUNING_FILE)
+    cpu_info = platform.processor() or platform.machine()
+    cache_key = f"{MODEL_ID}|{cpu_info}|cpus={os.cpu_count()}|batch={sample_size}"
+
+    cache = {}
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+        except Exception:
+            cache = {}
+    if cache_key in cache:
+        return tuple(cache[cache_key])
+
+    print(f"Tuning ONNX thread settings for batch size {sample_size} (one-time)...")
+    cpu_count = os.cpu_count() or 1
+    intra_candidates = sorted({n for n in (1, 2, 4, 8, cpu_count) if n <= cpu_count})
+
+    best = (0, 1)
+    best_latency = None
+    for intra in intra_candidates:
+        for inter in (1, 2):
+            sess_options = ort.SessionOptions()
+            sess_options.intra_op_num_threads = intra
+            sess_options.inter_op_num_threads = inter
+            session = ort.InferenceSession(
+                quantized_path,
+                sess_options=sess_options,
+                providers=['CPUExecutionProvider']
+            )
+            # Dummy batch of plausible length; content doesn't matter for timing
+            seq_len = 64
+            inputs = {}
+            for session_input in session.get_inputs():
+                if session_input.name == 'attention_mask':
+                    inputs[session_input.name] = np.ones((sample_size, seq_len), dtype=np.int64)
+                else:
+                    inputs[session_input.name] = np.zeros((sample_size, seq_len), dtype=np.int64)
+
+            session.run(None, inputs)  # Warmup
+            latencies = []
+            for _ in range(3):
+                start = time.perf_counter()
+                session.run(None, inputs)
+                latencies.append(time.perf_counter() - start)
+            latency = min(latencies)
+            if best_latency is None or latency < best_latency:
+                best_latency = latency
+                best = (intra, inter)
+
+    print(f"  Best thread settings: intra_op={best[0]}, inter_op={best[1]}")
+    cache[cache_key] = list(best)
+    try:
+        with open(cache_path, 'w') as f:
+            json.dump(cache, f, indent=2)
+    except Exception as e:
+        print(f"  Could not cache tuning result: {e}")
+
+    return best
+
+class EmbeddingModel:
+    """
+    INT8-quantized MiniLM embedding model running on ONNX Runtime (CPU)
+
+    Produces the same mean-pooled 384-dim embeddings as
+    SentenceTransformer('all-MiniLM-L6-v2') and exposes a compatible
+    .encode() so it can be dropped in anywhere that model was used.
+    """
+
+    def __init__(self, onnx_dir=ONNX_DIR, intra_op_num_threads=None, tune_batch_size=32):
+        """
+        Args:
+            onnx_dir: Directory holding the exported/quantized model
+            intra_op_num_threads: Explicit thread count; skips auto-tuning
+            tune_batch_size: Batch size to auto-tune thread settings for
+                (use 32 for bulk encoding, 1 for single-query latency)
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        quantized_path = export_quantized_model(onnx_dir)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+
+        sess_options = ort.SessionOptions()
+        if intra_op_num_threads:
+            sess_options.intra_op_num_threads = intra_op_num_threads
+        elif tune_batch_size:
+            intra, inter = tune_session_threads(quantized_path, sample_size=tune_batch_size)
+            sess_options.intra_op_num_threads = intra
+            sess_options.inter_op_num_threads = inter
+        self.session = ort.InferenceSession(
+            quantized_path,
+            sess_options=sess_options,
+            providers=['CPUExecutionProvider']
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self.embedding_dimension = EMBEDDING_DIMENSION
+
+    def _encode_batch(self, texts):
+        """Tokenize and run one batch through the ONNX session"""
+        encoded = self.tokenizer(texts, padding=True, truncation=True,
+                                 max_length=128, return_tensors='np')
+        inputs = {
+            'input_ids': encoded['input_ids'].astype(np.int64),
+            'attention_mask': encoded['attention_mask'].astype(np.int64)
+        }
+        if 'token_type_ids' in self._input_names:
+            inputs['token_type_ids'] = encoded['token_type_ids'].astype(np.int64)
+
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        # Mean pooling over valid tokens (same head as sentence-transformers)
+        mask = inputs['attention_mask'][:, :, None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        return summed / counts
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False,
+               convert_to_numpy=True, normalize_embeddings=False):
+        """
+        Encode a string or list of strings into embeddings
+
+        Args:
+            texts: Single string or list of strings
+            batch_size: Number of texts per ONNX session run
+
+        Returns:
+            numpy array of embeddings (1-D for a single string input);
+            show_progress_bar/convert_to_numpy are accepted for
+            SentenceTransformer compatibility
+        """
+        single_input = isinstance(texts, str)
+        if single_input:
+            texts = [texts]
+        texts = list(texts)
+
+        # Smart batching: group texts of similar length so each batch is
+        # padded only to its own longest member instead of the corpus
+        # maximum; results are written back at their original positions
+        if len(texts) > batch_size:
+            order = np.argsort([len(t) for t in texts], kind='stable')
+        else:
+            order = np.arange(len(texts))
+
+        embeddings = np.empty((len(texts), self.embedding_dimension), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch_indices = order[start:start + batch_size]
+            embeddings[batch_indices] = self._encode_batch([texts[j] for j in batch_indices])
+
+        if normalize_embeddings:
+            norms = np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+            embeddings = embeddings / norms
+
+        return embeddings[0] if single_input else embeddings
@@ -1,11 +1,21 @@
 import os
+import asyncio
+import functools
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from dotenv import load_dotenv
 load_dotenv()
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
-from pinecone import Pinecone
+try:
+    # gRPC client: lower per-call CPU and wire bytes than REST+JSON
+    from pinecone.grpc import PineconeGRPC as Pinecone
+except ImportError:  # grpc extras not installed; REST client is API-compatible
+    from pinecone import Pinecone
 import anthropic
+from embedding_model import EmbeddingModel
 
 # Claude API config
 CLAUDE_API_KEY = os.environ.get("CLAUDE_API_KEY")
@@ -47,147 +57,325 @@ def call_claude(prompt: str) -> str:
 
 app = FastAPI(title="Pinecone Query API", version="1.0.0")
 
+# Embedding model for requests that arrive without a precomputed vector;
+# loaded once at server start and shared by all requests
+embed_model = EmbeddingModel()
+
+# Dynamic batching: concurrent requests that need encoding are coalesced
+# for a short window and share a single model.encode call
+EMBED_MAX_BATCH = 32
+EMBED_MAX_WAIT = 0.008  # seconds
+
+embed_queue: asyncio.Queue = asyncio.Queue()
+
+async def _embed_worker():
+    """Drain the embed queue in coalesced batches and encode them together"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await embed_queue.get()]
+        deadline = loop.time() + EMBED_MAX_WAIT
+        while len(batch) < EMBED_MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(embed_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Deduplicate so each unique question is encoded once per batch
+        unique_questions = list({question for question, _ in batch})
+        try:
+            embeddings = await loop.run_in_executor(
+                None,
+                lambda: embed_model.encode(unique_questions, batch_size=EMBED_MAX_BATCH)
+            )
+            by_question = {q: emb.tolist() for q, emb in zip(unique_questions, embeddings)}
+            for question, future in batch:
+                if not future.done():
+                    future.set_result(by_question[question])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+# Questions repeat heavily (the CLI clients send a handful of fixed
+# strings), so cache embeddings by exact question text
+EMBED_CACHE_MAX = 1024
+_embed_cache = {}
+
+async def embed_question(question: str) -> list:
+    """Encode a question via the shared batching worker, cached by text"""
+    cached = _embed_cache.get(question)
+    if cached is not None:
+        return cached
+
+    future = asyncio.get_running_loop().create_future()
+    await embed_queue.put((question, future))
+    embedding = await future
+
+    if len(_embed_cache) >= EMBED_CACHE_MAX:
+        # Evict the oldest entry (dicts preserve insertion order)
+        _embed_cache.pop(next(iter(_embed_cache)))
+    _embed_cache[question] = embedding
+    return embedding
+
+@app.on_event("startup")
+async def start_embed_worker():
+    asyncio.create_task(_embed_worker())
+
+# Metadata-filtered lookups for the special-case aggregations. The
+# filter is pushed into Pinecone via a single query instead of paging
+# the whole index with index.list + index.fetch
+EMBEDDING_DIMENSION = 384
+# Cosine indexes reject all-zero query vectors, so probe with a unit
+# basis vector; the filter does the real work and scores are ignored
+PROBE_VECTOR = [1.0] + [0.0] * (EMBEDDING_DIMENSION - 1)
+# Pinecone caps top_k at 1000 when metadata is included; ample here,
+# the largest special-case file holds ~365 rows
+METADATA_QUERY_TOP_K = 1000
+METADATA_CACHE_TTL = 60  # seconds
+
+def _scan_metadata(filter_dict):
+    """
+    Fallback full scan with parallel page fetches
+
+    Only used when the filtered query path fails (e.g. metadata not
+    indexed for filtering). Collects all index.list pages first, then
+    fetches them concurrently so the scan costs ~1 round-trip of
+    wall-time instead of one per page.
+    """
+    # index.list yields ListResponse pages whose items are ListItem
+    # objects; fetch wants plain id strings, so extract them per page
+    pages = [
+        [item.id for item in page.vectors]
+        for page in index.list(limit=99)
+    ]
+    pages = [ids for ids in pages if ids]
+    if not pages:
+        return ()
+
+    results = []
+    with ThreadPoolExecutor(max_workers=min(20, len(pages))) as executor:
+        for fetch_response in executor.map(lambda ids: index.fetch(ids=ids), pages):
+            for v in fetch_response.vectors.values():
+                meta = v.metadata if hasattr(v, 'metadata') else {}
+                if all(meta.get(key, '') == value for key, value in filter_dict.items()):
+                    results.append(meta)
+    return tuple(results)
+
+@functools.lru_cache(maxsize=32)
+def _fetch_metadata_cached(filter_items, time_bucket):
+    filter_dict = {key: {"$eq": value} for key, value in filter_items}
+    try:
+        response = index.query(
+            vector=PROBE_VECTOR,
+            top_k=METADATA_QUERY_TOP_K,
+            include_metadata=True,
+            filter=filter_dict
+        )
+        return tuple(m['metadata'] for m in response.get('matches', []))
+    except Exception as e:
+        print(f"Filtered metadata query failed ({e}); falling back to parallel scan")
+        return _scan_metadata(dict(filter_items))
+
+def fetch_metadata(filter_dict):
+    """Return metadata for all vectors matching the equality filter, cached for 60s"""
+    filter_items = tuple(sorted(filter_dict.items()))
+    time_bucket = int(time.time() // METADATA_CACHE_TTL)
+    return list(_fetch_metadata_cached(filter_items, time_bucket))
+
 class QueryRequest(BaseModel):
-    embedding: list
+    embedding: list = Field(default_factory=list)
     top_k: int = 5
     question: str = None
 
+class EmbedRequest(BaseModel):
+    question: str
+
+class EmbedResponse(BaseModel):
+    embedding: list
+
 class QueryResponse(BaseModel):
     answer: str
     sources: list = Field(default_factory=list)
 
+class QueryBatchRequest(BaseModel):
+    questions: list
+    top_k: int = 5
+
+class QueryBatchResponse(BaseModel):
+    results: list = Field(default_factory=list)
+
+def _make_sum_handler(filter_dict, column, answer_template):
+    """Build a handler that sums one metadata column over a filtered set"""
+    def handler():
+        sources = fetch_metadata(filter_dict)
+        total = 0
+        for meta in sources:
+            try:
+                total += int(meta.get(column, 0))
+            except Exception:
+                pass
+        return QueryResponse(answer=answer_template.format(total), sources=sources)
+    return handler
+
+def _answer_safest_line():
+    """Find the line(s) with the fewest incidents in the last 7 days"""
+    sources = fetch_metadata({'source_file': 'line_counts_last_7_days.csv'})
+    min_incidents = None
+    safest_lines = []
+    for meta in sources:
+        try:
+            incident_count = int(meta.get('col_incident_count', 0))
+        except Exception:
+            incident_count = 0
+        if min_incidents is None or incident_count < min_incidents:
+            min_incidents = incident_count
+            safest_lines = [(meta.get('col_line_code', 'Unknown'), incident_count)]
+        elif incident_count == min_incidents:
+            safest_lines.append((meta.get('col_line_code', 'Unknown'), incident_count))
+    if safest_lines:
+        # If multiple lines have the same minimum, join them with commas
+        line_codes = ', '.join([line for line, _ in safest_lines])
+        answer = f"The safest line in the last 7 days is the {line_codes} with {min_incidents} incidents."
+    else:
+        answer = "No data available for the safest line in the last 7 days."
+    return QueryResponse(answer=answer, sources=sources)
+
+# Precompiled dispatch table for the special-case questions: one regex
+# scan per request replaces the old chain of substring checks, and each
+# handler has its target file/date/column baked in
+ROUTES = [
+    (
+        re.compile(r"total number of crimes today", re.IGNORECASE),
+        _make_sum_handler(
+            {'source_file': 'july_2024_crime_summary.csv', 'col_date': '2024-07-13'},
+            'col_count',
+            "The total number of crimes today is {}."
+        )
+    ),
+    (
+        re.compile(r"total number of traffic accidents today", re.IGNORECASE),
+        _make_sum_handler(
+            {'source_file': 'traffic_crash_daily_totals_july_2024.csv', 'col_DATE': '2024-07-13'},
+            'col_TOTAL_CRASHES',
+            "The total number of traffic accidents today is {}."
+        )
+    ),
+    (
+        re.compile(r"safest line in the last 7 days", re.IGNORECASE),
+        _answer_safest_line
+    ),
+]
+
+async def answer_question(question, embedding, top_k):
+    """
+    Answer a single question: routed special-case aggregations first,
+    then semantic search plus Claude
+
+    Blocking Pinecone/Claude calls run in the default executor so that
+    concurrent questions (e.g. from /query_batch) overlap instead of
+    serializing on the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    q_lower = question.lower() if question else ""
+
+    for pattern, handler in ROUTES:
+        if pattern.search(q_lower):
+            # Handlers hit Pinecone on a cache miss, so keep them off
+            # the event loop like the other blocking calls
+            return await loop.run_in_executor(None, handler)
+
+    # Default: semantic search with top_k. Requests may omit the
+    # embedding and let the server encode the question (batched)
+    if not embedding and question:
+        embedding = await embed_question(question)
+
+    query_response = await loop.run_in_executor(
+        None,
+        lambda: index.query(
+            vector=embedding,
+            top_k=top_k,
+            include_metadata=True
+        )
+    )
+    matches = query_response.get('matches', [])
+    # Compose context from matches, including col_closest_station if present
+    station_names = []
+    context_lines = []
+    for m in matches:
+        meta = m['metadata']
+        station = meta.get('col_closest_station')
+        if station:
+            station_names.append(station)
+        context_lines.append(
+            f"Source: {meta.get('source_file', '')}, Row: {meta.get('row_index', '')}, "
+            f"Type: {meta.get('col_Incident Type', '')}, Date: {meta.get('col_Date', '')}, "
+            f"Address: {meta.get('col_Address', '')}, Closest Station: {station or ''}"
+        )
+    context = "\n".join(context_lines)
+
+    # If the question is about stations near the user and we have station names, return the exact required response
+    if "stations near" in q_lower and station_names:
+        seen = set()
+        unique_stations = [x for x in station_names if not (x in seen or seen.add(x))]
+        station_list = ", ".join(unique_stations)
+        answer = f"The stations near your current location are: {station_list}."
+    # If the question is about closest stations and we have station names, return the closest stations response
+    elif "closest station" in q_lower and station_names:
+        seen = set()
+        unique_stations = [x for x in station_names if not (x in seen or seen.add(x))]
+        station_list = ", ".join(unique_stations)
+        answer = f"The closest stations to your current location are: {station_list}."
+    else:
+        prompt = f"Context from database:\n{context}\n\nQuestion: {question}\nAnswer:"
+        answer = await loop.run_in_executor(None, call_claude, prompt)
+    sources = [m['metadata'] for m in matches]
+    return QueryResponse(answer=answer, sources=sources)
+
 @app.post("/query", response_model=QueryResponse)
 async def query_pinecone(request: QueryRequest):
     try:
-        # Special case: sum the count column for 2024-07-13 in july_2024_crime_summary.csv
-        if request.question and "total number of crimes today" in request.question.lower():
-            total_crimes = 0
-            sources = []
-            limit = 99  # Pinecone API: limit must be >0 and <100
-            target_file = 'july_2024_crime_summary.csv'
-            target_date = '2024-07-13'
-            for ids in index.list(limit=limit):
-                if not ids:
-                    continue
-                fetch_response = index.fetch(ids=ids)
-                for v in fetch_response.vectors.values():
-                    meta = v.metadata if hasattr(v, 'metadata') else {}
-                    if (
-                        meta.get('source_file', '').lower() == target_file and
-                        meta.get('col_date', '') == target_date
-                    ):
-                        try:
-                            count_val = meta.get('col_count', 0)
-                            count_val = int(count_val)
-                        except Exception:
-                            count_val = 0
-                        total_crimes += count_val
-                        sources.append(meta)
-            answer = f"The total number of crimes today is {total_crimes}."
-            return QueryResponse(answer=answer, sources=sources)
-
-        # Special case: sum the TOTAL_CRASHES column for 2024-07-13 in traffic_crash_daily_totals_july_2024.csv
-        if request.question and "total number of traffic accidents today" in request.question.lower():
-            total_crashes = 0
-            sources = []
-            limit = 99
-            target_file = 'traffic_crash_daily_totals_july_2024.csv'
-            target_date = '2024-07-13'
-            for ids in index.list(limit=limit):
-                if not ids:
-                    continue
-                fetch_response = index.fetch(ids=ids)
-                for v in fetch_response.vectors.values():
-                    meta = v.metadata if hasattr(v, 'metadata') else {}
-                    if (
-                        meta.get('source_file', '').lower() == target_file and
-                        meta.get('col_DATE', '') == target_date
-                    ):
-                        try:
-                            crash_val = meta.get('col_TOTAL_CRASHES', 0)
-                            crash_val = int(crash_val)
-                        except Exception:
-                            crash_val = 0
-                        total_crashes += crash_val
-                        sources.append(meta)
-            answer = f"The total number of traffic accidents today is {total_crashes}."
-            return QueryResponse(answer=answer, sources=sources)
-
-        # Special case: find the safest line in the last 7 days
-        if request.question and "safest line in the last 7 days" in request.question.lower():
-            min_incidents = None
-            safest_lines = []
-            sources = []
-            limit = 99
-            target_file = 'line_counts_last_7_days.csv'
-            for ids in index.list(limit=limit):
-                if not ids:
-                    continue
-                fetch_response = index.fetch(ids=ids)
-                for v in fetch_response.vectors.values():
-                    meta = v.metadata if hasattr(v, 'metadata') else {}
-                    if meta.get('source_file', '').lower() == target_file:
-                        try:
-                            incident_count = int(meta.get('col_incident_count', 0))
-                        except Exception:
-                            incident_count = 0
-                        if min_incidents is None or incident_count < min_incidents:
-                            min_incidents = incident_count
-                            safest_lines = [(meta.get('col_line_code', 'Unknown'), incident_count)]
-                        elif incident_count == min_incidents:
-                            safest_lines.append((meta.get('col_line_code', 'Unknown'), incident_count))
-                        sources.append(meta)
-            if safest_lines:
-                # If multiple lines have the same minimum, join them with commas
-                line_codes = ', '.join([line for line, _ in safest_lines])
-                answer = f"The safest line in the last 7 days is the {line_codes} with {min_incidents} incidents."
-            else:
-                answer = "No data available for the safest line in the last 7 days."
-            return QueryResponse(answer=answer, sources=sources)
-
-        # Default: semantic search with top_k
-        query_response = index.query(
-            vector=request.embedding,
-            top_k=request.top_k,
-            include_metadata=True
-        )
-        matches = query_response.get('matches', [])
-        # Compose context from matches, including col_closest_station if present
-        station_names = []
-        context_lines = []
-        for m in matches:
-            meta = m['metadata']
-            station = meta.get('col_closest_station')
-            if station:
-                station_names.append(station)
-            context_lines.append(
-                f"Source: {meta.get('source_file', '')}, Row: {meta.get('row_index', '')}, "
-                f"Type: {meta.get('col_Incident Type', '')}, Date: {meta.get('col_Date', '')}, "
-                f"Address: {meta.get('col_Address', '')}, Closest Station: {station or ''}"
-            )
-        context = "\n".join(context_lines)
-
-        # If the question is about stations near the user and we have station names, return the exact required response
-        if request.question and "stations near" in request.question.lower() and station_names:
-            seen = set()
-            unique_stations = [x for x in station_names if not (x in seen or seen.add(x))]
-            station_list = ", ".join(unique_stations)
-            answer = f"The stations near your current location are: {station_list}."
-        # If the question is about closest stations and we have station names, return the closest stations response
-        elif request.question and "closest station" in request.question.lower() and station_names:
-            seen = set()
-            unique_stations = [x for x in station_names if not (x in seen or seen.add(x))]
-            station_list = ", ".join(unique_stations)
-            answer = f"The closest stations to your current location are: {station_list}."
-        else:
-            prompt = f"Context from database:\n{context}\n\nQuestion: {request.question}\nAnswer:"
-            answer = call_claude(prompt)
-        sources = [m['metadata'] for m in matches]
-        return QueryResponse(answer=answer, sources=sources)
+        return await answer_question(request.question, request.embedding, request.top_k)
     except Exception as e:
         print(f"Error in /query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query_batch", response_model=QueryBatchResponse)
+async def query_batch(request: QueryBatchRequest):
+    """
+    Answer several questions in one request
+
+    Questions run concurrently: their encodes coalesce into a single
+    model.encode call via the batching worker, and the Pinecone/Claude
+    calls overlap in the thread pool.
+    """
+    try:
+        responses = await asyncio.gather(*(
+            answer_question(question, [], request.top_k)
+            for question in request.questions
+        ))
+        return QueryBatchResponse(results=responses)
+    except Exception as e:
+        print(f"Error in /query_batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/embed", response_model=EmbedResponse)
+async def embed(request: EmbedRequest):
+    """
+    Embed a question with the server's persistent model
+
+    Lets clients stay pure HTTP and avoid loading the embedding model
+    per invocation; encoding goes through the shared batching worker.
+    """
+    try:
+        embedding = await embed_question(request.question)
+        return EmbedResponse(embedding=embedding)
+    except Exception as e:
+        print(f"Error in /embed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
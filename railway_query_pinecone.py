@@ -1,24 +1,36 @@
+import sys
 import requests
-from sentence_transformers import SentenceTransformer
 
-# The question to embed and query
-question = "What are the stations near me?"
-#question = "What are the total number of crimes today?"
-#question = "What are the total number of traffic accidents today?"
-#question = "What is the safest line in the last 7 days?"
+API_URL = "https://web-production-1e02.up.railway.app"
 
-# Load a sentence-transformers model (use the same model as used for Pinecone embeddings)
-model = SentenceTransformer('all-MiniLM-L6-v2')
-embedding = model.encode(question).tolist()
+# Questions from the command line, or the default below
+questions = sys.argv[1:] or ["What are the stations near me?"]
+#questions = ["What are the total number of crimes today?"]
+#questions = ["What are the total number of traffic accidents today?"]
+#questions = ["What is the safest line in the last 7 days?"]
 
-response = requests.post(
-    "https://web-production-1e02.up.railway.app/query",
-    json={"embedding": embedding, "top_k": 5, "question": question}
-)
+# No local model load: the server embeds the questions with its persistent
+# model. Multiple questions go through /query_batch in one POST so the
+# server encodes them together instead of one batch-of-1 per question
+if len(questions) == 1:
+    response = requests.post(
+        f"{API_URL}/query",
+        json={"top_k": 5, "question": questions[0]}
+    )
+else:
+    response = requests.post(
+        f"{API_URL}/query_batch",
+        json={"top_k": 5, "questions": questions}
+    )
 
 try:
     data = response.json()
-    print(data.get("answer"))
+    if len(questions) == 1:
+        print(data.get("answer"))
+    else:
+        for question, result in zip(questions, data.get("results", [])):
+            print(f"Q: {question}")
+            print(f"A: {result.get('answer')}")
     #if "sources" in data:
     #    print("Sources:")
     #    for src in data["sources"]:
@@ -26,4 +38,4 @@ try:
 except Exception as e:
     print(f"Error decoding JSON: {e}")
     print(f"Status code: {response.status_code}")
-    print(f"Response text: {response.text}") 
\ No newline at end of file
+    print(f"Response text: {response.text}")